@@ -0,0 +1,318 @@
+import time
+import os
+import sys
+import io
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import tracemalloc
+
+# --------------------------
+# Benchmarks
+# --------------------------
+# python benchmark.py                     run and compare with the baseline
+# python benchmark.py --save-baseline     run and store the results as the baseline
+# python benchmark.py --ci                as above, but fail when there is no baseline
+#
+# Every corpus is generated from a fixed seed, so runs on the same machine
+# measure the same work. A stage fails when its median time (or peak memory)
+# grows more than the threshold over the stored baseline.
+#
+# Timings only compare on the same machine, so the baseline is not committed
+# (it is gitignored). A CI job keeps it next to its cache: it restores the
+# file, runs --ci, and refreshes it with --save-baseline on the main branch.
+# To refresh a local baseline, run --save-baseline on an unchanged checkout.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.environ.get("TEXT2PPT_BENCH_BASELINE", os.path.join(BASE_DIR, "benchmark_baseline.json"))
+THRESHOLD = float(os.environ.get("TEXT2PPT_BENCH_THRESHOLD", "0.25"))
+MEMORY_THRESHOLD = float(os.environ.get("TEXT2PPT_BENCH_MEMORY_THRESHOLD", "0.25"))
+# Slowdowns smaller than this are timer noise, whatever the ratio.
+MIN_DELTA_MS = float(os.environ.get("TEXT2PPT_BENCH_MIN_DELTA_MS", "1.0"))
+REPEAT = int(os.environ.get("TEXT2PPT_BENCH_REPEAT", "5"))
+SEED = 1500
+
+PDF_PAGES = 300
+IMAGE_COUNT = 4
+
+WORDS = (
+    "market growth energy policy data model system design process network "
+    "research result analysis method value change public health country "
+    "water climate school student teacher learning city transport cost "
+    "price company product customer service quality budget report project "
+    "team plan risk security software hardware cloud storage signal power"
+).split()
+
+# --------------------------
+# Synthetic Corpora
+# --------------------------
+def make_sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+def make_text(rng, words):
+    sentences = []
+    count = 0
+    while count < words:
+        sentence = make_sentence(rng)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+def make_pdf(pages_text):
+    # Minimal PDF: Helvetica text, one content stream per page.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages_text))), len(pages_text))).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, lines in enumerate(pages_text):
+        content = "BT /F1 10 Tf 50 780 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        ).encode())
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def make_docx(rng, path):
+    from docx import Document
+
+    document = Document()
+    for _ in range(8):
+        document.add_heading(" ".join(rng.choice(WORDS) for _ in range(3)).title(), level=1)
+        for _ in range(4):
+            document.add_paragraph(make_text(rng, 60))
+        table = document.add_table(rows=6, cols=4)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = " ".join(rng.choice(WORDS) for _ in range(3))
+    document.save(path)
+
+def make_image(rng, size, alpha=False):
+    from PIL import Image
+
+    fractal = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), rng.randint(60, 120))
+    gradient = Image.linear_gradient("L").resize(size)
+    img = Image.merge("RGB", (fractal, gradient, gradient.rotate(rng.randint(0, 359))))
+    buffer = io.BytesIO()
+    if alpha:
+        img.putalpha(Image.radial_gradient("L").resize(size))
+        img.save(buffer, "PNG")
+    else:
+        img.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+def build_corpus(folder, seed=SEED):
+    rng = random.Random(seed)
+    corpus = {
+        "note": make_text(rng, 60),
+        "essay": make_text(rng, 1500),
+        "long": make_text(rng, 50000),
+    }
+
+    corpus["txt_path"] = os.path.join(folder, "essay.txt")
+    with open(corpus["txt_path"], "w", encoding="utf-8") as f:
+        f.write(corpus["essay"])
+
+    corpus["pdf_path"] = os.path.join(folder, "report.pdf")
+    pages = [[make_sentence(rng) for _ in range(40)] for _ in range(PDF_PAGES)]
+    with open(corpus["pdf_path"], "wb") as f:
+        f.write(make_pdf(pages))
+
+    corpus["docx_path"] = os.path.join(folder, "tables.docx")
+    make_docx(rng, corpus["docx_path"])
+
+    corpus["images"] = [
+        make_image(rng, (2400, 1800), alpha=(i == IMAGE_COUNT - 1)) for i in range(IMAGE_COUNT)
+    ]
+    return corpus
+
+# --------------------------
+# Stages
+# --------------------------
+# Each case gets the corpus and returns the callable to time, so any
+# preparation it needs (a built presentation for "save") stays untimed.
+
+def image_case(t2p, corpus):
+    def run():
+        return [t2p.process_image(data) for data in corpus["images"]]
+    return run
+
+def build_slides(t2p, titles, summaries, image_paths=()):
+    prs = t2p.new_presentation()
+    footer = t2p.footer_text("bench")
+    for i, (title, content) in enumerate(zip(titles, summaries)):
+        image_path = image_paths[i] if i < len(image_paths) else None
+        t2p.add_content_slide(prs, title, content, image_path, footer)
+    t2p.add_closing_slides(prs, "Benchmark corpus", footer)
+    return prs
+
+def pipeline(t2p, corpus, text=None, path=None, images=False):
+    def run():
+        source = text
+        if path:
+            source = t2p.ingest_document(path, os.path.splitext(path)[-1], t2p.MAX_WORDS)["text"]
+        titles, summaries = t2p.summarize_text(source, t2p.MAX_WORDS)
+        image_paths = [io.BytesIO(data) for data in image_case(t2p, corpus)()] if images else []
+        return t2p.render_presentation(titles, summaries, image_paths, "Benchmark corpus", "bench")
+    return run
+
+def engine_cases(t2p, corpus):
+    # Every summarizer engine on the essay and on a large-document-sized text.
+    cases = {}
+    for name in t2p.SUMMARIZER_ENGINES:
+        essay = t2p.EnhancedSummarizer(max_words=t2p.MAX_WORDS, engine=name)
+        long = t2p.EnhancedSummarizer(max_words=t2p.LARGE_DOC_MAX_WORDS, engine=name)
+        cases[f"summarize_essay_{name}"] = lambda s=essay: lambda: s.summarize(corpus["essay"], t2p.MAX_SLIDES)
+        cases[f"summarize_long_{name}"] = lambda s=long: lambda: s.summarize(corpus["long"], t2p.LARGE_DOC_MAX_SLIDES)
+    return cases
+
+def stage_cases(t2p, corpus):
+    essay_slides = t2p.summarize_text(corpus["essay"], t2p.MAX_WORDS)
+    summarizer = t2p.EnhancedSummarizer(max_words=t2p.MAX_WORDS)
+
+    def save_case():
+        prs = build_slides(t2p, *essay_slides)
+        return lambda: t2p.presentation_bytes(prs)
+
+    return {
+        "extract_txt": lambda: lambda: t2p.ingest_document(corpus["txt_path"], ".txt", t2p.MAX_WORDS),
+        "extract_docx": lambda: lambda: t2p.ingest_document(corpus["docx_path"], ".docx", t2p.MAX_WORDS),
+        "extract_pdf": lambda: lambda: t2p.extract_text_from_pdf(corpus["pdf_path"], t2p.MAX_WORDS),
+        "pdf_page_count": lambda: lambda: t2p.pdf_page_count(corpus["pdf_path"]),
+        "summarize_note": lambda: lambda: summarizer.summarize(corpus["note"], t2p.MAX_SLIDES),
+        **engine_cases(t2p, corpus),
+        "images": lambda: image_case(t2p, corpus),
+        "build_slides": lambda: lambda: build_slides(t2p, *essay_slides),
+        "save": save_case,
+        "pipeline_note": lambda: pipeline(t2p, corpus, text=corpus["note"]),
+        "pipeline_essay": lambda: pipeline(t2p, corpus, text=corpus["essay"]),
+        "pipeline_pdf": lambda: pipeline(t2p, corpus, path=corpus["pdf_path"]),
+        "pipeline_docx": lambda: pipeline(t2p, corpus, path=corpus["docx_path"]),
+        "pipeline_images": lambda: pipeline(t2p, corpus, text=corpus["essay"], images=True),
+    }
+
+# --------------------------
+# Runner
+# --------------------------
+def measure(case, repeat):
+    case()()  # warm-up: imports, templates, caches
+
+    times = []
+    for _ in range(repeat):
+        run = case()
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+
+    # Peak memory is taken on a separate run: tracemalloc slows everything down.
+    run = case()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+def compare(results, baseline, threshold, memory_threshold, min_delta_ms=MIN_DELTA_MS):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["median_ms"] > max(base["median_ms"] * (1 + threshold), base["median_ms"] + min_delta_ms):
+            regressions.append(f"{name}: {base['median_ms']:.1f} ms -> {result['median_ms']:.1f} ms")
+        if result["peak_kb"] > base["peak_kb"] * (1 + memory_threshold):
+            regressions.append(f"{name}: {base['peak_kb']:.0f} KB -> {result['peak_kb']:.0f} KB peak")
+    return regressions
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Text2PPT pipeline benchmarks.")
+    parser.add_argument("stages", nargs="*", help="Stages to run (default: all).")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Timed runs per stage.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline.")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Allowed slowdown of the median time, as a fraction (0.25 = 25%%).")
+    parser.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS,
+                        help="Ignore slowdowns smaller than this many milliseconds.")
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD,
+                        help="Allowed growth of peak memory, as a fraction.")
+    parser.add_argument("--ci", action="store_true", default=os.environ.get("CI", "").lower() in ("1", "true", "yes"),
+                        help="Fail when the baseline or a stage in it is missing (default when CI is set).")
+    args = parser.parse_args(argv)
+
+    if args.ci and not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first.", file=sys.stderr)
+        return 2
+
+    work_dir = tempfile.mkdtemp(prefix="text2ppt-bench-")
+    os.environ.setdefault("TEXT2PPT_DB", os.path.join(work_dir, "bench.db"))
+    os.environ.setdefault("TEXT2PPT_POOL_MODE", "inline")
+    try:
+        sys.path.insert(0, BASE_DIR)
+        import text2ppt as t2p
+
+        corpus = build_corpus(work_dir)
+        cases = stage_cases(t2p, corpus)
+        unknown = [name for name in args.stages if name not in cases]
+        if unknown:
+            parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(cases)})")
+
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+
+        results = {}
+        print(f"{'stage':<28}{'median ms':>12}{'min ms':>12}{'peak KB':>12}{'baseline ms':>14}")
+        for name in args.stages or cases:
+            results[name] = measure(cases[name], args.repeat)
+            base = baseline.get(name, {}).get("median_ms")
+            print(f"{name:<28}{results[name]['median_ms']:>12.1f}{results[name]['min_ms']:>12.1f}"
+                  f"{results[name]['peak_kb']:>12.0f}{'-' if base is None else f'{base:.1f}':>14}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        print(f"Not in the baseline, not compared: {', '.join(missing)}", file=sys.stderr)
+        if args.ci:
+            return 2
+
+    regressions = compare(results, baseline, args.threshold, args.memory_threshold, args.min_delta_ms)
+    if regressions:
+        print("Regressions:")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# text2ppt opens DB_FILE when it is imported; tests get their own database.
+os.environ.setdefault("TEXT2PPT_DB", os.path.join(tempfile.mkdtemp(), "text2ppt.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
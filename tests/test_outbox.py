@@ -0,0 +1,177 @@
+import email
+import email.policy
+import os
+import socketserver
+import threading
+import time
+
+import pytest
+
+import text2ppt
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    # Just enough SMTP for smtplib: EHLO, MAIL, RCPT, DATA, NOOP, RSET, QUIT.
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.messages = []
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 stand-in ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 stand-in")
+            elif command == b"DATA":
+                self.reply("354 go ahead")
+                lines = []
+                for data in iter(self.rfile.readline, b""):
+                    if data.rstrip(b"\r\n") == b".":
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                self.server.messages.append(email.message_from_bytes(b"".join(lines), policy=email.policy.default))
+                self.reply("250 queued")
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = SMTPStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(text2ppt, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(text2ppt, "SMTP_PORT", server.server_address[1])
+    monkeypatch.setattr(text2ppt, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(text2ppt, "SMTP_USER", "")
+    monkeypatch.setattr(text2ppt, "SMTP_FROM", "text2ppt@example.com")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = text2ppt.EmailOutbox(os.path.join(tmp_path, "outbox.db"), 1)
+    yield box
+    box.stop()
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_delivers_deck_as_attachment(smtp_server, outbox):
+    outbox.start()
+    message_id = outbox.enqueue("user@example.com", "Your PPT", "Attached.", b"pptx bytes", "deck.pptx")
+
+    assert wait_for(lambda: outbox.status(message_id)["status"] == "sent")
+    assert outbox.status(message_id)["attempts"] == 1
+    assert outbox.pending() == 0
+    [message] = smtp_server.messages
+    assert message["To"] == "user@example.com"
+    [attachment] = list(message.iter_attachments())
+    assert attachment.get_filename() == "deck.pptx"
+    assert attachment.get_content() == b"pptx bytes"
+
+
+def test_reuses_smtp_connection(smtp_server, outbox):
+    outbox.start()
+    ids = [outbox.enqueue("user@example.com", "PPT", "Attached.", b"x", "deck.pptx") for _ in range(3)]
+
+    assert wait_for(lambda: all(outbox.status(i)["status"] == "sent" for i in ids))
+    assert len(smtp_server.messages) == 3
+    assert len(outbox.pool._idle) == 1
+
+
+def test_retries_then_fails_when_server_is_down(monkeypatch, outbox):
+    monkeypatch.setattr(text2ppt, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(text2ppt, "SMTP_PORT", 1)
+    monkeypatch.setattr(text2ppt, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(text2ppt, "OUTBOX_RETRY_DELAY", 0)
+    monkeypatch.setattr(text2ppt, "OUTBOX_MAX_ATTEMPTS", 2)
+    outbox.start()
+    message_id = outbox.enqueue("user@example.com", "PPT", "Attached.", b"x", "deck.pptx")
+
+    assert wait_for(lambda: outbox.status(message_id)["status"] == "failed")
+    status = outbox.status(message_id)
+    assert status["attempts"] == 2
+    assert status["last_error"]
+
+
+def test_leased_messages_are_left_to_their_sender(outbox):
+    fresh = outbox.enqueue("a@example.com", "PPT", "Attached.", b"x", "deck.pptx")
+    stale = outbox.enqueue("b@example.com", "PPT", "Attached.", b"x", "deck.pptx")
+    outbox.db.execute(
+        "UPDATE outbox SET status = 'sending', claimed_by = 'other', claimed_at = ? WHERE public_id = ?",
+        (time.time(), fresh),
+    )
+    outbox.db.execute(
+        "UPDATE outbox SET status = 'sending', claimed_by = 'other', claimed_at = ? WHERE public_id = ?",
+        (time.time() - text2ppt.OUTBOX_LEASE - 1, stale),
+    )
+
+    row = outbox._claim()
+    assert row["public_id"] == stale
+    assert outbox._claim() is None
+    assert outbox.status(fresh)["status"] == "sending"
+
+
+def test_sender_survives_status_update_errors(smtp_server, outbox, monkeypatch):
+    failures = []
+    connect_db = text2ppt.connect_db
+
+    class LockedConnection:
+        # The sender thread's connection; every status update hits a lock.
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, sql, params=()):
+            if sql.startswith("UPDATE outbox SET status = 'sent'"):
+                failures.append(sql)
+                raise text2ppt.sqlite3.OperationalError("database is locked")
+            return self.conn.execute(sql, params)
+
+    monkeypatch.setattr(text2ppt, "connect_db", lambda path: LockedConnection(connect_db(path)))
+    outbox.start()
+    message_id = outbox.enqueue("user@example.com", "PPT", "Attached.", b"x", "deck.pptx")
+
+    assert wait_for(lambda: failures)
+    assert all(thread.is_alive() for thread in outbox._threads)
+    assert outbox.status(message_id)["status"] == "sending"
+
+
+def test_status_is_looked_up_by_opaque_id_without_recipient(outbox):
+    first = outbox.enqueue("a@example.com", "PPT", "Attached.", b"x", "deck.pptx")
+    second = outbox.enqueue("b@example.com", "PPT", "Attached.", b"x", "deck.pptx")
+    assert len({first, second}) == 2 and not first.isdigit()
+    assert outbox.status(first)["id"] == first
+    assert "to_email" not in outbox.status(first)
+    assert outbox.status("1") is None
+
+
+def test_smtp_without_sender_refuses_to_start(monkeypatch):
+    monkeypatch.setattr(text2ppt, "SMTP_USER", "mailer")
+    monkeypatch.setattr(text2ppt, "SMTP_FROM", "")
+    with pytest.raises(RuntimeError):
+        text2ppt.check_smtp_config()
+    monkeypatch.setattr(text2ppt, "SMTP_FROM", "text2ppt@example.com")
+    text2ppt.check_smtp_config()
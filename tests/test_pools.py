@@ -0,0 +1,35 @@
+import asyncio
+import os
+
+import pytest
+
+import text2ppt
+
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    monkeypatch.setattr(text2ppt, "POOL_MODE", "process")
+    text2ppt.shutdown_pools()
+    yield
+    text2ppt.shutdown_pools()
+
+
+def kill_worker(pool):
+    # Ends one worker the way a crash or the OOM killer would.
+    with pytest.raises(text2ppt.BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+
+
+def test_pool_is_replaced_after_a_worker_dies(process_pool):
+    pool = text2ppt.get_cpu_pool()
+    kill_worker(pool)
+    assert asyncio.run(text2ppt.run_cpu(pow, 2, 10)) == 1024
+    assert text2ppt.get_cpu_pool() is not pool
+    assert asyncio.run(text2ppt.run_cpu(pow, 3, 2)) == 9
+
+
+def test_task_that_keeps_killing_workers_is_a_503(process_pool):
+    with pytest.raises(text2ppt.GenerationError) as e:
+        asyncio.run(text2ppt.run_cpu(os._exit, 1))
+    assert e.value.status_code == 503
+    assert asyncio.run(text2ppt.run_cpu(pow, 2, 3)) == 8
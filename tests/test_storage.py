@@ -0,0 +1,31 @@
+import os
+
+import text2ppt
+
+
+def make_storage(tmp_path, quota):
+    folder = str(tmp_path / "storage")
+    return text2ppt.BlobStore(str(tmp_path / "text2ppt.db"), folder, text2ppt.LocalArtifactStore(folder), quota)
+
+
+def test_oldest_uploads_expire_over_quota(tmp_path):
+    storage = make_storage(tmp_path, 10)
+    storage.put_bytes("upload", b"first!", "ram", "u1", 60)
+    storage.put_bytes("upload", b"second", "ram", "u2", 60)
+    assert storage.lookup("upload", "u1") is None
+    assert storage.lookup("upload", "u2") is not None
+    assert storage.usage("ram")["bytes"] == 6
+
+
+def test_decks_over_quota_leave_uploads_alone(tmp_path):
+    # Decks are never evicted, so they do not count toward the quota: a
+    # user whose decks alone exceed it can still upload.
+    storage = make_storage(tmp_path, 10)
+    storage.put_bytes("deck", b"a deck bigger than the quota", "ram", "d1", 60)
+    storage.put_bytes("upload", b"first", "ram", "u1", 60)
+    storage.put_bytes("upload", b"other", "ram", "u2", 60)
+    assert storage.lookup("upload", "u1") is not None
+    assert storage.lookup("upload", "u2") is not None
+    assert storage.lookup("deck", "d1") is not None
+    assert storage.usage("ram")["bytes"] == 10
+    assert os.path.exists(storage.find("deck", "d1"))